@@ -1,11 +1,13 @@
 # .github/scripts/gitflow.py
 #!/usr/bin/env python3
 import os
-import re
-import platform
 import sys
+import shlex
+import shutil
 import argparse
-from git import Repo, GitCommandError
+import threading
+import subprocess
+# GitPython and pygit2 are imported lazily
 
 # ANSI color codes
 GREEN = '\033[92m'
@@ -15,14 +17,37 @@ CYAN = '\033[96m'
 RESET = '\033[0m'
 MAGENTA = '\033[95m'
 
+# Characters not allowed anywhere in a branch name
+_BAD = frozenset('~^:?*[\\ ')
+
+# Marker echoed before each step of a chained git pipeline
+STEP_MARKER = '::step:'
+
+# Hooks run by `git checkout` / `git commit`
+COMMIT_HOOKS = ('pre-commit', 'prepare-commit-msg', 'commit-msg', 'post-commit', 'post-checkout')
+
+# In-process libgit2 handle, opened once and reused for read-only queries
+_PG_REPO = None
+
+# ----------------------------------------
+# Output
+# ----------------------------------------
+def print_banner(title):
+    sys.stdout.write(f"\n{CYAN}{'='*10} {title} {'='*10}{RESET}\n\n")
+
+def print_section(title, color=CYAN):
+    sys.stdout.write(f"\n{color}###### {title} ######{RESET}\n")
+
 # ----------------------------------------
 # Validators & Prompts
 # ----------------------------------------
 def valid_branch(name: str) -> bool:
-    return bool(re.match(r'^(?!/|.*([~^:\?\*\[\\])).+(?<!/)$', name))
+    if not name or name.startswith('/') or name.endswith('/'):
+        return False
+    return _BAD.isdisjoint(name)
 
 def prompt_branch(repo, arg_branch=None):
-    print(f"\n{CYAN}###### Branch Setup ######{RESET}")
+    print_section("Branch Setup")
     if arg_branch:
         if not valid_branch(arg_branch):
             print(f"{RED}[Error]{RESET} Invalid branch name: {arg_branch}")
@@ -35,8 +60,32 @@ def prompt_branch(repo, arg_branch=None):
             continue
         return name
 
+def _getch():
+    # Read a single keystroke; piped input falls back to one line
+    if not sys.stdin.isatty():
+        return sys.stdin.readline()[:1]
+    # Drop anything typed after the key
+    if os.name == 'nt':
+        import msvcrt
+        c = msvcrt.getwch()
+        while msvcrt.kbhit():
+            msvcrt.getwch()
+        return c
+    import termios
+    import tty
+    fd = sys.stdin.fileno()
+    old = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        # Unbuffered read, so tcflush sees the leftover keystrokes
+        c = os.read(fd, 4).decode(errors='ignore')[:1]
+        termios.tcflush(fd, termios.TCIFLUSH)
+        return c
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old)
+
 def prompt_commit_msg(arg_msg=None):
-    print(f"\n{CYAN}###### Commit Setup ######{RESET}")
+    print_section("Commit Setup")
     if arg_msg:
         return arg_msg
     while True:
@@ -44,53 +93,180 @@ def prompt_commit_msg(arg_msg=None):
         if not msg:
             print(f"{YELLOW}[Warning]{RESET} Commit message cannot be empty.")
             continue
-        confirm = input(f"{CYAN}? Confirm message [y/N]:{RESET} ").lower()
-        if confirm.startswith('y'):
+        print(f"{CYAN}? Confirm message [y/N]:{RESET} ", end='', flush=True)
+        c = _getch().lower()
+        # Enter is a plain "N": end the prompt line without echoing it
+        print('' if c in ('\r', '\n') else c)
+        if c == 'y':
             return msg
         
 def clear_screen():
-    if platform.system() == "Windows":
-        os.system("cls")  # Command for clearing the screen on Windows
+    # Clear the screen and scrollback
+    sys.stdout.write('\x1b[H\x1b[2J\x1b[3J')
+    sys.stdout.flush()
+
+def _libgit2_repo(git_dir):
+    # Open the handle on first call, return the cached one after that
+    global _PG_REPO
+    import pygit2
+    if _PG_REPO is None:
+        _PG_REPO = pygit2.Repository(git_dir)
+    return _PG_REPO
+
+def _working_tree_status(repo):
+    # Path -> status flags, ignored files left out
+    return _libgit2_repo(repo.git_dir).status(ignored=False)
+
+def _has_untracked(repo):
+    import pygit2
+    return any(flags & pygit2.GIT_STATUS_WT_NEW for flags in _working_tree_status(repo).values())
+
+def _start_fetch(origin):
+    # Fetch in the background without credential prompts; retry in the foreground on failure
+    env = {'GIT_TERMINAL_PROMPT': '0'}
+    if not (os.environ.get('GIT_SSH_COMMAND') or os.environ.get('GIT_SSH')
+            or origin.repo.config_reader().get_value('core', 'sshCommand', '')):
+        env['GIT_SSH_COMMAND'] = 'ssh -o BatchMode=yes'
+    errors = []
+
+    def run():
+        try:
+            with origin.repo.git.custom_environment(**env):
+                origin.fetch()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    def wait():
+        thread.join()
+        if errors:
+            origin.fetch()
+    return wait
+
+def _has_commit_hooks(repo):
+    # Hooks the regular checkout/commit would run but the plumbing path skips
+    config = _libgit2_repo(repo.git_dir).config
+    if 'core.hooksPath' in config:
+        hooks = os.path.join(repo.working_tree_dir, os.path.expanduser(config['core.hooksPath']))
     else:
-        os.system("clear")  # Command for clearing the screen on Linux/macOS
+        hooks = os.path.join(repo.git_dir, 'hooks')
+    for name in COMMIT_HOOKS:
+        path = os.path.join(hooks, name)
+        # Git for Windows runs any hook file; elsewhere it must be executable
+        if os.path.isfile(path) and (os.name == 'nt' or os.access(path, os.X_OK)):
+            return True
+    return False
+
+def _signs_commits(repo):
+    # commit-tree ignores commit.gpgSign, so signed repos need `git commit`
+    config = _libgit2_repo(repo.git_dir).config
+    return 'commit.gpgSign' in config and config.get_bool('commit.gpgSign')
 
-def fetch_and_pull(repo):
-    print(f"\n{MAGENTA}###### Fetching Remote Changes ######{RESET}")
+def fetch_and_pull(repo, origin, wait_for_fetch, dirty):
+    import pygit2
+    from git import GitCommandError
+    print_section("Fetching Remote Changes", MAGENTA)
     try:
-        origin = repo.remote('origin')
-        origin.fetch()
+        wait_for_fetch()
         print(f"{GREEN}[OK]{RESET} Fetched latest changes from remote.")
 
-        # Check if there are changes on the remote
-        remote_diff = repo.git.log('HEAD..origin/main', '--oneline')
+        # Check if there are changes on the remote (HEAD..origin/main)
+        pg = _libgit2_repo(repo.git_dir)
+        remote = pg.references[f'refs/remotes/{origin.name}/main'].target
+        head = pg.head.target
+        remote_diff = remote != head and not pg.descendant_of(head, remote)
         if remote_diff:
             print(f"{CYAN}[Info]{RESET} Changes detected on the remote repository.")
             
             # Check if the working tree is clean
-            if repo.is_dirty(untracked_files=True):
+            if dirty:
                 print(f"{YELLOW}[Warning]{RESET} Local changes detected. Stashing changes before pulling.")
-                repo.git.stash('save', '--include-untracked')
+                saved = repo.git.stash('save', '--include-untracked')
                 
                 # Pull changes from the remote
-                repo.git.pull('origin', 'main')
+                repo.git.pull(origin.name, 'main')
                 print(f"{GREEN}[OK]{RESET} Pulled latest changes into 'main'.")
 
                 # Pop the stash if it was created
-                if repo.git.stash('list'):
+                if 'No local changes' not in saved:
                     print(f"{CYAN}[Info]{RESET} Restoring stashed changes.")
                     repo.git.stash('pop')
         else:
             # Check if the working tree is clean
-            if not repo.is_dirty(untracked_files=True):
+            if not dirty:
                 print(f"{YELLOW}[Notice]{RESET} No changes on the remote and the working tree is clean.")
                 print(f"{CYAN}[Info]{RESET} Please make some changes before running the script again.")
                 sys.exit(0)
             else:
                 print(f"{CYAN}[Info]{RESET} No changes detected on the remote. Proceeding with the script.")
-    except GitCommandError as e:
+    except (GitCommandError, pygit2.GitError, KeyError) as e:
         print(f"{RED}[Error]{RESET} Fetch/Pull failed: {e}")
         sys.exit(1)
 
+def _shell():
+    # bash on PATH; not on Windows, where it may be WSL's
+    if os.name == 'nt':
+        return None
+    return shutil.which('bash')
+
+def _run_steps(repo, steps):
+    # Run all steps in one `bash -c`, with a marker echoed before each step
+    shell = _shell()
+    if shell is None:
+        return _run_each(repo, steps)
+    script = ' && '.join(
+        f"echo {shlex.quote(STEP_MARKER + name)} && "
+        f"{cmd if isinstance(cmd, str) else shlex.join(cmd)}"
+        for name, cmd in steps
+    )
+    try:
+        result = subprocess.run(
+            [shell, '-c', script],
+            cwd=repo.working_tree_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            check=False,
+        )
+    except OSError as e:
+        if any(isinstance(cmd, str) for _, cmd in steps):
+            return [], steps[0][0], f"could not run {shell}: {e}"
+        return _run_each(repo, steps)
+    started, output = [], []
+    for line in result.stdout.splitlines():
+        if line.startswith(STEP_MARKER):
+            started.append(line[len(STEP_MARKER):])
+            output = []
+        else:
+            output.append(line)
+    if result.returncode == 0:
+        return started, None, ''
+    # The last step that started is the one that failed
+    failed = started.pop() if started else steps[0][0]
+    return started, failed, '\n'.join(output).strip()
+
+def _run_each(repo, steps):
+    # Run the steps one at a time when there is no bash
+    done = []
+    for name, cmd in steps:
+        try:
+            result = subprocess.run(
+                cmd,
+                cwd=repo.working_tree_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                check=False,
+            )
+        except OSError as e:
+            return done, name, str(e)
+        if result.returncode != 0:
+            return done, name, result.stdout.strip()
+        done.append(name)
+    return done, None, ''
+
 # ----------------------------------------
 # Main Workflow
 # ----------------------------------------
@@ -103,60 +279,88 @@ def main():
     parser.add_argument("--branch", "-b", help="Branch name to create/use")
     parser.add_argument("--message", "-m", help="Commit message to use")
     args = parser.parse_args()
+    import pygit2
+    from git import Repo
 
     # Open repo
     try:
-        repo = Repo('.', search_parent_directories=True)
+        repo = Repo(_libgit2_repo(pygit2.discover_repository(os.getcwd())).path)
     except Exception:
         print(f"{RED}[Error]{RESET} Not a git repository.")
         sys.exit(1)
 
-    # Fetch and pull changes
-    fetch_and_pull(repo)
-    # Banner
-    print(f"\n{CYAN}{'='*10} Starting Gitflow {'='*10}{RESET}\n")
-
-    # 1. Branch Creation & Checkout
-    branch = prompt_branch(repo, args.branch)
-    try:
-        repo.git.checkout('-b', branch)
-        print(f"{GREEN}[OK]{RESET} Switched to branch: {branch}")
-    except GitCommandError:
-        try:
-            repo.git.checkout(branch)
-            print(f"{GREEN}[OK]{RESET} Checked out existing branch: {branch}")
-        except GitCommandError as e:
-            print(f"{RED}[Error]{RESET} Could not checkout branch: {e}")
-            sys.exit(1)
-
-    # 2. Stage Changes
     try:
-        repo.git.add('--all')
-        print(f"{GREEN}[OK]{RESET} Staged all changes")
-    except GitCommandError as e:
-        print(f"{RED}[Error]{RESET} Staging failed: {e}")
+        origin = repo.remote('origin')
+    except ValueError:
+        print(f"{RED}[Error]{RESET} No 'origin' remote.")
         sys.exit(1)
 
-    # 3. Commit
+    dirty = any(_working_tree_status(repo).values())
+    if dirty:
+        # Fetch while the branch name is entered
+        wait_for_fetch = _start_fetch(origin)
+    else:
+        # Clean tree: check for an early exit before prompting
+        fetch_and_pull(repo, origin, origin.fetch, dirty)
+    # Banner
+    print_banner("Starting Gitflow")
+
+    # Prompts first, so the whole flow can run as one pipeline
+    branch = prompt_branch(repo, args.branch)
+    if dirty:
+        # Pull changes once the fetch is done
+        fetch_and_pull(repo, origin, wait_for_fetch, dirty)
     msg = prompt_commit_msg(args.message)
-    try:
-        repo.git.commit('-m', msg)
-        print(f"{GREEN}[OK]{RESET} Committed: '{msg}'")
-    except GitCommandError as e:
-        print(f"{RED}[Error]{RESET} Commit failed: {e}")
-        sys.exit(1)
 
-    # 5. Push Feature Branch
-    try:
-        origin = repo.remote('origin')
-        origin.push(branch)
-        print(f"{GREEN}[OK]{RESET} Pushed '{branch}' to origin")
-    except GitCommandError as e:
-        print(f"{RED}[Error]{RESET} Push failed: {e}")
+    # 1-4. Checkout, Stage, Commit & Push Feature Branch
+    ref = f"refs/heads/{branch}"
+    exists = ref in _libgit2_repo(repo.git_dir).references
+    push = ('push', ['git', 'push', origin.name, branch])
+    steps = [
+        ('checkout', ['git', 'checkout', branch] if exists else ['git', 'checkout', '-b', branch]),
+        ('add', ['git', 'add', '--all']),
+        ('commit', ['git', 'commit', '-m', msg]),
+        push,
+    ]
+    # Only tracked files changed: `commit -a` stages them
+    if not _has_untracked(repo):
+        steps[1:3] = [('commit', ['git', 'commit', '-a', '-m', msg])]
+    if args.branch and args.message and not exists and _shell() \
+            and not _has_commit_hooks(repo) and not _signs_commits(repo):
+        # Nothing prompted: build the commit with plumbing, no checkout
+        quoted = shlex.quote(ref)
+        steps = [
+            ('add', ['git', 'add', '--all']),
+            ('commit', "TREE=$(git write-tree)"
+                       " && { [ \"$TREE\" != \"$(git rev-parse 'HEAD^{tree}')\" ]"
+                       " || { echo 'nothing to commit, working tree clean'; false; }; }"
+                       f" && COMMIT=$(git commit-tree \"$TREE\" -p HEAD -m {shlex.quote(msg)})"),
+            ('checkout', f"git update-ref -m {shlex.quote(f'gitflow: create {branch}')} {quoted} \"$COMMIT\" ''"
+                         f" && git symbolic-ref -m {shlex.quote(f'gitflow: switch to {branch}')} HEAD {quoted}"),
+            push,
+        ]
+    ok = {
+        'checkout': f"Checked out existing branch: {branch}" if exists else f"Switched to branch: {branch}",
+        'add': "Staged all changes",
+        'commit': f"Committed: '{msg}'",
+        'push': f"Pushed '{branch}' to origin",
+    }
+    errors = {
+        'checkout': "Could not checkout branch",
+        'add': "Staging failed",
+        'commit': "Commit failed",
+        'push': "Push failed",
+    }
+    done, failed, output = _run_steps(repo, steps)
+
+    for name in done:
+        print(f"{GREEN}[OK]{RESET} {ok[name]}")
+    if failed:
+        print(f"{RED}[Error]{RESET} {errors[failed]}: {output}")
         sys.exit(1)
 
     # Done
-    print(f"\n{CYAN}{'='*10} Gitflow Complete {'='*10}{RESET}\n")
+    print_banner("Gitflow Complete")
 
 if __name__ == "__main__":
     main()